@@ -1,20 +1,24 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Iterator, List, Optional
 import os
-import io
 import requests
-from bs4 import BeautifulSoup
 from pypdf import PdfReader
 import yt_dlp
 import google.generativeai as genai
 from dotenv import load_dotenv
 import logging
 
+from app import profiling
+from app.pipeline import collect_chunks, iter_html_text, iter_response_text
+from app.profiling import stage
+
 load_dotenv()
 
 app = FastAPI()
+app.middleware("http")(profiling.profile_requests)
+app.include_router(profiling.router)
 
 logger = logging.getLogger(__name__)
 
@@ -29,30 +33,27 @@ class SummaryRequest(BaseModel):
     url: Optional[str] = None
     summary_length: str = "medium"
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
+def iter_text_from_pdf(stream) -> Iterator[str]:
     try:
-        reader = PdfReader(io.BytesIO(file_bytes))
-        text = ""
+        with stage("pdf.parse"):
+            reader = PdfReader(stream)
         for page in reader.pages:
-            text += page.extract_text() or ""
+            with stage("pdf.parse"):
+                text = page.extract_text() or ""
+            yield text
         logger.info("Successfully extracted text from PDF.")
-        return text
     except Exception as e:
         logger.error(f"Failed to extract text from PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to process PDF file: {e}")
 
-def extract_text_from_url(url: str) -> str:
+def iter_text_from_url(url: str) -> Iterator[str]:
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        for script in soup(["script", "style"]):
-            script.decompose()
-        text = soup.get_text(separator="\n")
-        lines = [line.strip() for line in text.splitlines()]
-        text = "\n".join(line for line in lines if line)
+        with stage("url.fetch"):
+            response = requests.get(url, timeout=10, stream=True)
+        with response:
+            response.raise_for_status()
+            yield from iter_html_text(iter_response_text(response))
         logger.info(f"Successfully extracted text from URL: {url}")
-        return text
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to fetch URL: {e}")
         raise HTTPException(status_code=400, detail=f"Failed to fetch URL: {e}")
@@ -60,7 +61,7 @@ def extract_text_from_url(url: str) -> str:
         logger.error(f"Failed to parse URL content: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to parse URL content: {e}")
 
-def extract_text_from_youtube(youtube_url: str) -> str:
+def iter_text_from_youtube(youtube_url: str) -> Iterator[str]:
     logger.info(f"Extracting transcript from YouTube URL: {youtube_url}")
     ydl_opts = {
         'quiet': True,
@@ -72,28 +73,28 @@ def extract_text_from_youtube(youtube_url: str) -> str:
     }
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(youtube_url, download=False)
+            with stage("yt_dlp.extract_info"):
+                info = ydl.extract_info(youtube_url, download=False)
             video_id = info.get("id")
             subtitle_file = f"{video_id}.en.vtt"
             if not os.path.exists(subtitle_file):
                 logger.info("No pre-existing subtitle file found. Attempting to download.")
                 ydl_opts['writeautomaticsub'] = True
-                info = ydl.extract_info(youtube_url, download=True)
+                with stage("yt_dlp.download"):
+                    info = ydl.extract_info(youtube_url, download=True)
                 subtitle_file = f"{video_id}.en.vtt"
                 if not os.path.exists(subtitle_file):
                     logger.error("No English subtitles found for this video after download attempt.")
                     raise HTTPException(status_code=404, detail="No English subtitles found for this video")
 
+        try:
             with open(subtitle_file, 'r') as f:
-                lines = f.readlines()
+                for line in f:
+                    if line.strip() and not line.startswith(('WEBVTT', 'NOTE', 'STYLE', 'REGION')) and '-->' not in line:
+                        yield line
+        finally:
             os.remove(subtitle_file)
-            logger.info(f"Successfully extracted and cleaned up subtitles for video ID: {video_id}")
-
-            text_lines = []
-            for line in lines:
-                if line.strip() and not line.startswith(('WEBVTT', 'NOTE', 'STYLE', 'REGION')) and '-->' not in line:
-                    text_lines.append(line.strip())
-            return "\n".join(text_lines)
+        logger.info(f"Successfully extracted and cleaned up subtitles for video ID: {video_id}")
     except yt_dlp.utils.DownloadError as e:
         logger.error(f"yt-dlp download error: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid YouTube URL or video not found: {e}")
@@ -101,7 +102,7 @@ def extract_text_from_youtube(youtube_url: str) -> str:
         logger.error(f"Failed to extract subtitles: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to extract subtitles: {e}")
 
-def call_gemini_api(text: str, summary_length: str) -> str:
+def call_gemini_api(chunks: List[str], summary_length: str) -> str:
     logger.info(f"Calling Gemini API for summary (length: {summary_length})")
     length_prompts = {
         "short": "Provide a very short, one-sentence summary.",
@@ -113,7 +114,8 @@ def call_gemini_api(text: str, summary_length: str) -> str:
     model = genai.GenerativeModel('gemini-pro')
     
     try:
-        response = model.generate_content(f"{prompt}\n\n{text}")
+        with stage("gemini.generate"):
+            response = model.generate_content([prompt, *chunks])
         logger.info("Successfully received summary from Gemini API.")
         return response.text
     except Exception as e:
@@ -131,27 +133,27 @@ async def summarize(
         logger.warning("Summarize request with no URL or file.")
         raise HTTPException(status_code=400, detail="Either a URL or a file must be provided.")
 
-    text = ""
+    fragments = None
     source = ""
     if file:
         source = f"file: {file.filename}"
         if file.content_type != "application/pdf":
             logger.warning(f"Invalid file type uploaded: {file.content_type}")
             raise HTTPException(status_code=400, detail="File must be a PDF.")
-        file_bytes = await file.read()
-        text = extract_text_from_pdf(file_bytes)
+        fragments = iter_text_from_pdf(file.file)
     elif url:
         source = f"url: {url}"
         if "youtube.com" in url or "youtu.be" in url:
-            text = extract_text_from_youtube(url)
+            fragments = iter_text_from_youtube(url)
         else:
-            text = extract_text_from_url(url)
+            fragments = iter_text_from_url(url)
 
-    if not text.strip():
+    chunks = collect_chunks(fragments)
+    if not chunks:
         logger.warning(f"No text could be extracted from source: {source}")
         raise HTTPException(status_code=400, detail="Could not extract any text from the provided source.")
 
-    summary = call_gemini_api(text, summary_length)
+    summary = call_gemini_api(chunks, summary_length)
     return JSONResponse(content={"summary": summary})
 
 @app.get("/")
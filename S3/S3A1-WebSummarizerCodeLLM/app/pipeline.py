@@ -0,0 +1,186 @@
+"""Streaming text pipeline between the extractors and the summarizer.
+
+Extractors yield text fragments instead of returning whole documents. The
+fragments are pulled through normalize -> compact -> limit -> chunk, so the
+only buffers are the current fragment and the chunk being assembled. Once the
+token budget is spent the pipeline stops pulling and the upstream generator
+is closed, which stops the download / page parsing early.
+
+    MAX_INPUT_TOKENS    hard cap on the text sent to the model per request
+    MAX_DOWNLOAD_BYTES  hard cap on bytes read from a fetched URL
+    CHUNK_CHARS         size of the chunks handed to the summarizer
+"""
+import codecs
+import logging
+import os
+from html.parser import HTMLParser
+from typing import Iterable, Iterator, List
+
+from app.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "30000"))
+MAX_DOWNLOAD_BYTES = int(os.getenv("MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+CHUNK_CHARS = int(os.getenv("CHUNK_CHARS", "8000"))
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def iter_response_text(response, max_bytes: int = MAX_DOWNLOAD_BYTES) -> Iterator[str]:
+    """Decodes a streamed `requests` response block by block."""
+    try:
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    received = 0
+    blocks = response.iter_content(READ_CHUNK_BYTES)
+    try:
+        while True:
+            with stage("url.download"):
+                block = next(blocks, None)
+            if block is None:
+                break
+            received += len(block)
+            if received > max_bytes:
+                logger.warning(f"Stopped reading {response.url} after {max_bytes} bytes")
+                break
+            yield decoder.decode(block)
+        yield decoder.decode(b"", final=True)
+    finally:
+        response.close()
+
+
+class _TextCollector(HTMLParser):
+    """Collects text outside script/style as it is parsed.
+
+    The parser may split a text node across feed() calls, so the unfinished
+    last line is held until a newline or the next tag; complete lines are
+    released straight away. The held line is capped at `max_line_chars` so a
+    page without tags or newlines cannot grow it past the token budget.
+    """
+
+    SKIPPED_TAGS = ("script", "style")
+
+    def __init__(self, max_line_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.fragments = []
+        self.max_line_chars = max_line_chars
+        self._pending = []
+        self._pending_chars = 0
+        self._skip_depth = 0
+
+    def _flush(self):
+        if self._pending:
+            self.fragments.append("".join(self._pending))
+            self._pending = []
+            self._pending_chars = 0
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if "\n" in data:
+            complete, _, rest = data.rpartition("\n")
+            self._pending.append(complete)
+            self._flush()
+            data = rest
+        if data:
+            self._pending.append(data)
+            self._pending_chars += len(data)
+        if self._pending_chars >= self.max_line_chars:
+            self._flush()
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def iter_html_text(chunks: Iterable[str], max_line_chars: int = MAX_INPUT_TOKENS * CHARS_PER_TOKEN) -> Iterator[str]:
+    """Yields the visible text of an HTML document fed in pieces."""
+    parser = _TextCollector(max_line_chars)
+    for chunk in chunks:
+        with stage("html.parse"):
+            parser.feed(chunk)
+        yield from parser.fragments
+        parser.fragments.clear()
+    with stage("html.parse"):
+        parser.close()
+    yield from parser.fragments
+
+
+def normalize_lines(fragments: Iterable[str]) -> Iterator[str]:
+    for fragment in fragments:
+        for line in fragment.splitlines():
+            line = line.strip()
+            if line:
+                yield line
+
+
+def compact_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Collapses inner whitespace and drops consecutive duplicate lines."""
+    previous = None
+    for line in lines:
+        line = " ".join(line.split())
+        if line != previous:
+            yield line
+        previous = line
+
+
+def limit_tokens(lines: Iterable[str], max_tokens: int = MAX_INPUT_TOKENS) -> Iterator[str]:
+    budget = max_tokens * CHARS_PER_TOKEN
+    for line in lines:
+        if len(line) >= budget:
+            if budget > 0:
+                yield line[:budget]
+            logger.info(f"Input truncated at the {max_tokens} token limit")
+            return
+        budget -= len(line) + 1
+        yield line
+
+
+def chunk_lines(lines: Iterable[str], chunk_chars: int = CHUNK_CHARS) -> Iterator[str]:
+    """Packs lines into chunks of at most `chunk_chars`, splitting longer lines."""
+    buffer = []
+    size = 0
+    for line in lines:
+        for start in range(0, len(line), chunk_chars):
+            piece = line[start:start + chunk_chars]
+            if buffer and size + len(piece) > chunk_chars:
+                yield "\n".join(buffer)
+                buffer = []
+                size = 0
+            buffer.append(piece)
+            size += len(piece) + 1
+    if buffer:
+        yield "\n".join(buffer)
+
+
+def collect_chunks(
+    fragments: Iterable[str],
+    max_tokens: int = MAX_INPUT_TOKENS,
+    chunk_chars: int = CHUNK_CHARS,
+) -> List[str]:
+    """Runs extractor output through the pipeline and returns the chunks for the model.
+
+    A source generator is always closed, so it can release its response or
+    file as soon as the token budget is reached.
+    """
+    try:
+        return list(chunk_lines(limit_tokens(compact_lines(normalize_lines(fragments)), max_tokens), chunk_chars))
+    finally:
+        close = getattr(fragments, "close", None)
+        if close is not None:
+            close()
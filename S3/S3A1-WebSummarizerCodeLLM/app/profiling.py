@@ -0,0 +1,263 @@
+"""Opt-in request profiling for the summarizer API.
+
+Everything is configured through environment variables and is off unless
+PROFILING_ENABLED is set:
+
+    PROFILING_ENABLED          turn the profiling surface on ("true"/"1")
+    PROFILE_SAMPLE_RATE        fraction of requests to profile (0.0 - 1.0)
+    PROFILE_SLOW_THRESHOLD_MS  capture any request slower than this (0 = off)
+    PROFILE_INTERVAL_MS        stack sampling interval
+    PROFILE_BUFFER_SIZE        number of captures kept in memory
+    PROFILE_ADMIN_TOKEN        token for the /admin/profiles endpoints and the
+                               X-Debug-Profile request header
+
+Captures are stored as collapsed stacks ("folded" format), which
+flamegraph.pl, speedscope and inferno can all read directly.
+
+One sampler thread serves the whole process. Requests share the event loop
+thread, so a sample is credited to the request whose stage() is running at
+that moment; outside any stage it is only credited when a single profiled
+request is in flight. Stages of unprofiled requests mark the thread too, so
+their samples are dropped rather than credited to a profiled request. Stage times are per request and summed by name, since
+streamed stages run once per block; duration_ms is wall clock and includes
+time spent blocked behind overlapping requests.
+"""
+import collections
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_THRESHOLD_MS = float(os.getenv("PROFILE_SLOW_THRESHOLD_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+PROFILE_DEBUG_HEADER = "X-Debug-Profile"
+PROFILED_PATHS = ("/summarize",)
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+_captures = collections.deque(maxlen=PROFILE_BUFFER_SIZE)
+_captures_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _fold_stack(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Samples the threads of all in-flight profiles from a single thread."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._active = {}
+        self._running = {}
+        self._thread = None
+
+    def register(self, profile, thread_id: int):
+        with self._cond:
+            self._active[profile] = thread_id
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def is_active(self) -> bool:
+        return bool(self._active)
+
+    def unregister(self, profile):
+        with self._cond:
+            self._active.pop(profile, None)
+
+    def set_running(self, thread_id: int, profile):
+        """Marks which profile owns `thread_id`; returns the previous owner."""
+        with self._cond:
+            previous = self._running.get(thread_id)
+            if profile is None:
+                self._running.pop(thread_id, None)
+            else:
+                self._running[thread_id] = profile
+            return previous
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            time.sleep(self.interval)
+            self._sample()
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._cond:
+            by_thread = collections.defaultdict(list)
+            for profile, thread_id in self._active.items():
+                by_thread[thread_id].append(profile)
+            for thread_id, profiles in by_thread.items():
+                frame = frames.get(thread_id)
+                owner = self._running.get(thread_id)
+                if owner is None and len(profiles) == 1:
+                    owner = profiles[0]
+                if frame is not None and owner in profiles:
+                    owner.stacks[_fold_stack(frame)] += 1
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, reason: Optional[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.stages = collections.Counter()
+        self.stacks = collections.Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 1),
+            "samples": sum(self.stacks.values()),
+            "stages": [{"name": name, "duration_ms": round(ms, 1)} for name, ms in self.stages.items()],
+        }
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+_sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+_UNPROFILED = object()
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Records how long a block takes against the current request's profile."""
+    profile = _current_profile.get()
+    if profile is None and not _sampler.is_active():
+        yield
+        return
+    thread_id = threading.get_ident()
+    previous = _sampler.set_running(thread_id, profile or _UNPROFILED)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.stages[name] += (time.perf_counter() - start) * 1000
+        _sampler.set_running(thread_id, previous)
+
+
+def _token_matches(value: Optional[str]) -> bool:
+    if not PROFILE_ADMIN_TOKEN or not value:
+        return False
+    # Header values are latin-1 decoded and compare_digest rejects non-ASCII str.
+    return secrets.compare_digest(value.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+def _profile_reason(request: Request) -> Optional[str]:
+    if _token_matches(request.headers.get(PROFILE_DEBUG_HEADER)):
+        return "debug-header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+async def profile_requests(request: Request, call_next):
+    if not PROFILING_ENABLED or request.url.path not in PROFILED_PATHS:
+        return await call_next(request)
+
+    reason = _profile_reason(request)
+    if reason is None and PROFILE_SLOW_THRESHOLD_MS <= 0:
+        return await call_next(request)
+
+    # The sampler follows the event loop thread, which is where the
+    # (synchronous) extractors and the model call run for this app.
+    profile = RequestProfile(request.method, request.url.path, reason)
+    token = _current_profile.set(profile)
+    start = time.perf_counter()
+    _sampler.register(profile, threading.get_ident())
+    try:
+        response = await call_next(request)
+    finally:
+        _sampler.unregister(profile)
+        profile.duration_ms = (time.perf_counter() - start) * 1000
+        _current_profile.reset(token)
+        _finish(profile)
+
+    if profile.reason:
+        response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+def _finish(profile: RequestProfile):
+    if PROFILE_SLOW_THRESHOLD_MS > 0 and profile.duration_ms >= PROFILE_SLOW_THRESHOLD_MS:
+        profile.reason = profile.reason or "slow"
+        stages = ", ".join(f"{name}={ms:.0f}ms" for name, ms in profile.stages.items())
+        logger.warning(
+            f"Slow request {profile.method} {profile.path} took {profile.duration_ms:.0f} ms "
+            f"(stages: {stages or 'none'}); profile id {profile.id}"
+        )
+    if not profile.reason:
+        return
+    with _captures_lock:
+        _captures.append(profile)
+    logger.info(f"Stored profile {profile.id} ({profile.reason}) for {profile.method} {profile.path}")
+
+
+def require_admin(token: Optional[str]):
+    if not PROFILING_ENABLED or not PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _token_matches(token):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+router = APIRouter(prefix="/admin/profiles")
+
+
+@router.get("")
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    with _captures_lock:
+        captures = list(_captures)
+    return {"profiles": [profile.summary() for profile in reversed(captures)]}
+
+
+@router.get("/{profile_id}")
+def download_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    with _captures_lock:
+        profile = next((p for p in _captures if p.id == profile_id), None)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return PlainTextResponse(
+        profile.folded(),
+        headers={"Content-Disposition": f'attachment; filename="{profile.id}.folded"'},
+    )
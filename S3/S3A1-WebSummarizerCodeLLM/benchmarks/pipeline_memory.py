@@ -0,0 +1,118 @@
+"""Peak RSS of the extraction pipeline as the input document grows.
+
+Each size runs in a fresh interpreter so ru_maxrss is not carried over.
+The synthetic HTML has a distinct line per paragraph and is generated lazily,
+in 64 KiB blocks, the way a streamed HTTP response is read. --document pre
+puts every line in a single <pre> text node instead, with no tags in it.
+
+    python benchmarks/pipeline_memory.py              # default token cap
+    python benchmarks/pipeline_memory.py --uncapped   # cap above input size
+    python benchmarks/pipeline_memory.py --document pre --uncapped
+    python benchmarks/pipeline_memory.py --mode beautifulsoup  # old path
+
+With the default cap reading stops early, so "read MB" stays small. With
+--uncapped the whole input is parsed and the chunks are drained as they are
+produced, which shows the parsing buffers stay bounded. The beautifulsoup
+mode is the pre-streaming extractor: the whole body, a soup, get_text(),
+splitlines() and a join.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.pipeline import (  # noqa: E402
+    MAX_INPUT_TOKENS,
+    chunk_lines,
+    collect_chunks,
+    compact_lines,
+    iter_html_text,
+    limit_tokens,
+    normalize_lines,
+)
+
+SIZES_MB = (1, 4, 16, 64)
+BLOCK = 64 * 1024
+
+
+class Document:
+    def __init__(self, size_mb: int, shape: str):
+        self.target = size_mb * 1024 * 1024
+        self.shape = shape
+        self.read = 0
+
+    def _line(self, index: int, words: str) -> str:
+        if self.shape == "pre":
+            return f"line {index}: {words}\n"
+        if index % 10 == 0:
+            return "<script>var x = " + "1" * 200 + ";</script>\n"
+        return f"<p>paragraph {index}: {words}</p>\n"
+
+    def __iter__(self):
+        words = " ".join(f"word{i}" for i in range(100))
+        index = 0
+        yield "<html><body><pre>\n" if self.shape == "pre" else "<html><body>\n"
+        while self.read < self.target:
+            block = []
+            block_size = 0
+            while block_size < BLOCK:
+                index += 1
+                block.append(self._line(index, words))
+                block_size += len(block[-1])
+            self.read += block_size
+            yield "".join(block)
+        yield "</pre></body></html>\n" if self.shape == "pre" else "</body></html>\n"
+
+
+def run_one(size_mb: int, mode: str, shape: str, uncapped: bool):
+    document = Document(size_mb, shape)
+    max_tokens = document.target if uncapped else MAX_INPUT_TOKENS
+    if mode == "beautifulsoup":
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup("".join(document), "html.parser")
+        for script in soup(["script", "style"]):
+            script.decompose()
+        text = soup.get_text(separator="\n")
+        lines = [line.strip() for line in text.splitlines()]
+        text = "\n".join(line for line in lines if line)
+        output_chars = len(text)
+    elif uncapped:
+        lines = limit_tokens(compact_lines(normalize_lines(iter_html_text(document))), max_tokens)
+        output_chars = sum(len(chunk) for chunk in chunk_lines(lines))
+    else:
+        output_chars = sum(len(chunk) for chunk in collect_chunks(iter_html_text(document), max_tokens))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux.
+    peak_kib = peak // 1024 if sys.platform == "darwin" else peak
+    return document.read, output_chars, peak_kib
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("streaming", "beautifulsoup"), default="streaming")
+    parser.add_argument("--document", choices=("paragraphs", "pre"), default="paragraphs")
+    parser.add_argument("--uncapped", action="store_true", help="raise the token cap above the input size")
+    parser.add_argument("--size", type=int, help="run a single size (MB) and print its results")
+    args = parser.parse_args()
+
+    if args.size:
+        print(*run_one(args.size, args.mode, args.document, args.uncapped))
+        return
+
+    cap = "uncapped" if args.uncapped or args.mode == "beautifulsoup" else f"{MAX_INPUT_TOKENS} tokens"
+    print(f"mode: {args.mode}, document: {args.document}, cap: {cap}")
+    print(f"{'input MB':>10} {'read MB':>10} {'output chars':>14} {'peak RSS MB':>12}")
+    for size_mb in SIZES_MB:
+        command = [sys.executable, __file__, "--mode", args.mode, "--document", args.document, "--size", str(size_mb)]
+        if args.uncapped:
+            command.append("--uncapped")
+        read, output_chars, peak_kib = map(int, subprocess.check_output(command, text=True).split())
+        print(f"{size_mb:>10} {read / 1024 / 1024:>10.1f} {output_chars:>14} {peak_kib / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
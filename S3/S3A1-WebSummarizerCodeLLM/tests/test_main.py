@@ -0,0 +1,151 @@
+import io
+import os
+from pathlib import Path
+
+import pytest
+import requests
+from fastapi import HTTPException
+from pypdf import PageObject, PdfReader, PdfWriter
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from app import main  # noqa: E402
+from app.pipeline import collect_chunks  # noqa: E402
+
+TEST_PDF = Path(__file__).resolve().parent.parent / "test.pdf"
+
+
+class FakeResponse:
+    encoding = "utf-8"
+    url = "http://example.com/page"
+
+    def __init__(self, blocks, status_code=200):
+        self.blocks = blocks
+        self.status_code = status_code
+        self.blocks_read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for block in self.blocks:
+            self.blocks_read += 1
+            yield block
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Client Error")
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def endless_html():
+    yield b"<html><body>"
+    i = 0
+    while True:
+        i += 1
+        yield b"".join(f"<p>paragraph {i}-{j}</p>".encode() for j in range(100))
+
+
+def test_url_extractor_closes_response_when_cap_is_hit(monkeypatch):
+    response = FakeResponse(endless_html())
+    monkeypatch.setattr(main.requests, "get", lambda url, **kwargs: response)
+
+    chunks = collect_chunks(main.iter_text_from_url("http://example.com/page"), max_tokens=200)
+
+    assert chunks[0].startswith("paragraph 1-0\nparagraph 1-1")
+    assert response.closed
+    assert response.blocks_read < 5
+
+
+def test_url_extractor_closes_response_on_http_error(monkeypatch):
+    response = FakeResponse([b"<p>not found</p>"], status_code=404)
+    monkeypatch.setattr(main.requests, "get", lambda url, **kwargs: response)
+
+    with pytest.raises(HTTPException) as excinfo:
+        collect_chunks(main.iter_text_from_url("http://example.com/missing"))
+
+    assert excinfo.value.status_code == 400
+    assert response.closed
+    assert response.blocks_read == 0
+
+
+VTT = """WEBVTT
+
+00:00:00.000 --> 00:00:02.000
+first caption
+
+00:00:02.000 --> 00:00:04.000
+second caption
+
+00:00:04.000 --> 00:00:06.000
+third caption
+"""
+
+
+class FakeYoutubeDL:
+    def __init__(self, opts):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def extract_info(self, url, download=False):
+        if download:
+            Path("vid123.en.vtt").write_text(VTT)
+        return {"id": "vid123"}
+
+
+@pytest.fixture
+def fake_youtube(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    return tmp_path / "vid123.en.vtt"
+
+
+def test_youtube_extractor_yields_caption_lines(fake_youtube):
+    lines = list(main.iter_text_from_youtube("https://youtube.com/watch?v=vid123"))
+
+    assert [line.strip() for line in lines] == ["first caption", "second caption", "third caption"]
+    assert not fake_youtube.exists()
+
+
+def test_youtube_extractor_removes_file_when_closed_early(fake_youtube):
+    fragments = main.iter_text_from_youtube("https://youtube.com/watch?v=vid123")
+
+    assert next(fragments).strip() == "first caption"
+    assert fake_youtube.exists()
+    fragments.close()
+    assert not fake_youtube.exists()
+
+
+def test_pdf_extractor_parses_one_page_at_a_time(monkeypatch):
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_page(PdfReader(TEST_PDF).pages[0])
+    stream = io.BytesIO()
+    writer.write(stream)
+    stream.seek(0)
+
+    extracted = []
+    extract_text = PageObject.extract_text
+
+    def counting_extract_text(page, *args, **kwargs):
+        extracted.append(page)
+        return extract_text(page, *args, **kwargs)
+
+    monkeypatch.setattr(PageObject, "extract_text", counting_extract_text)
+    pages = main.iter_text_from_pdf(stream)
+
+    assert "test PDF file" in next(pages)
+    assert len(extracted) == 1
+    assert len(list(pages)) == 2
+    assert len(extracted) == 3
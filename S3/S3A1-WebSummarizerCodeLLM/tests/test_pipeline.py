@@ -0,0 +1,79 @@
+import pytest
+
+from app.pipeline import collect_chunks, iter_html_text
+
+# Expected text is what BeautifulSoup's get_text(separator="\n") gives after
+# stripping lines, dropping blank ones and collapsing inner whitespace.
+DOCUMENTS = [
+    (
+        "<html><head><style>a{}</style><title>T</title></head><body><p>Hello <b>big</b> world &amp; co</p>"
+        "<script>if(a<b){}</script>\n\n<div>  x  </div></body></html>",
+        "T\nHello\nbig\nworld & co\nx",
+    ),
+    (
+        "<ul><li>one</li><li>two<br/>three</li></ul><!-- comment --><p>caf&eacute; &#8212; done</p>",
+        "one\ntwo\nthree\ncaf\u00e9 \u2014 done",
+    ),
+    (
+        "<table><tr><td>a  b</td><td>\n c \n</td></tr></table><style>p{}</style>tail",
+        "a b\nc\ntail",
+    ),
+]
+
+
+@pytest.mark.parametrize("html, expected", DOCUMENTS)
+@pytest.mark.parametrize("feed_size", [1, 3, 7, 64, 10_000])
+def test_html_text(html, expected, feed_size):
+    pieces = [html[i:i + feed_size] for i in range(0, len(html), feed_size)]
+    assert "\n".join(collect_chunks(iter_html_text(pieces))) == expected
+
+
+def test_token_cap_stops_reading_and_closes_source():
+    pulled = []
+    closed = []
+
+    def source():
+        try:
+            for i in range(1_000_000):
+                pulled.append(i)
+                yield f"line {i:04d} " * 10
+        finally:
+            closed.append(True)
+
+    chunks = collect_chunks(source(), max_tokens=100, chunk_chars=150)
+
+    assert closed == [True]
+    assert len(pulled) < 10
+    assert sum(len(chunk) for chunk in chunks) <= 100 * 4
+    assert all(len(chunk) <= 150 for chunk in chunks)
+
+
+def test_collect_chunks_accepts_plain_iterators():
+    assert collect_chunks(iter(["a", "b"])) == ["a\nb"]
+
+
+@pytest.mark.parametrize("separator", ["\n", " "])
+def test_token_cap_stops_reading_inside_a_single_text_node(separator):
+    pulled = []
+
+    def document():
+        yield "<html><body><pre>"
+        for i in range(100_000):
+            pulled.append(i)
+            yield separator.join(f"line {i}-{j}" for j in range(1000)) + separator
+        yield "</pre></body></html>"
+
+    chunks = collect_chunks(iter_html_text(document(), max_line_chars=400), max_tokens=100)
+
+    assert len(pulled) < 5
+    assert sum(len(chunk) for chunk in chunks) <= 100 * 4
+
+
+def test_long_lines_are_split_into_chunk_sized_pieces():
+    line = "".join(f"{i:05d}" for i in range(2000))
+
+    chunks = collect_chunks(iter(["short", line, "tail"]), chunk_chars=3000)
+
+    assert all(len(chunk) <= 3000 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "") == "short" + line + "tail"
+    assert chunks[-1].endswith("\ntail")
@@ -0,0 +1,186 @@
+import asyncio
+import collections
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import profiling
+
+TOKEN = "secret-token"
+
+
+def busy_a(ms):
+    end = time.perf_counter() + ms / 1000
+    while time.perf_counter() < end:
+        pass
+
+
+def busy_b(ms):
+    end = time.perf_counter() + ms / 1000
+    while time.perf_counter() < end:
+        pass
+
+
+BUSY = {"a": busy_a, "b": busy_b}
+
+app = FastAPI()
+app.middleware("http")(profiling.profile_requests)
+app.include_router(profiling.router)
+
+
+@app.post("/summarize")
+async def summarize(work: str = "a", ms: int = 0, before: float = 0, after: float = 0):
+    await asyncio.sleep(before)
+    with profiling.stage(f"busy.{work}"):
+        BUSY[work](ms)
+    await asyncio.sleep(after)
+    return {"ok": True}
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", TOKEN)
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(profiling, "PROFILE_SLOW_THRESHOLD_MS", 0.0)
+    monkeypatch.setattr(profiling, "_captures", collections.deque(maxlen=20))
+    return monkeypatch
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def admin_list(client):
+    response = client.get("/admin/profiles", headers={"X-Admin-Token": TOKEN})
+    assert response.status_code == 200
+    return response.json()["profiles"]
+
+
+def test_unselected_requests_are_not_profiled(client):
+    response = client.post("/summarize", headers={"X-Debug-Profile": "wrong"})
+
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert admin_list(client) == []
+
+
+def test_debug_header_profiles_request(client):
+    response = client.post("/summarize?ms=50", headers={"X-Debug-Profile": TOKEN})
+
+    profile_id = response.headers["x-profile-id"]
+    [profile] = admin_list(client)
+    assert profile["id"] == profile_id
+    assert profile["reason"] == "debug-header"
+    assert profile["samples"] > 0
+    assert [stage["name"] for stage in profile["stages"]] == ["busy.a"]
+    assert profile["stages"][0]["duration_ms"] >= 50
+
+
+def test_sample_rate_selects_requests(client, settings):
+    settings.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+
+    response = client.post("/summarize")
+
+    assert "x-profile-id" in response.headers
+    assert admin_list(client)[0]["reason"] == "sampled"
+
+
+def test_slow_requests_are_captured(client, settings):
+    settings.setattr(profiling, "PROFILE_SLOW_THRESHOLD_MS", 40.0)
+
+    fast = client.post("/summarize")
+    slow = client.post("/summarize?ms=60")
+
+    assert "x-profile-id" not in fast.headers
+    [profile] = admin_list(client)
+    assert profile["reason"] == "slow"
+    assert profile["duration_ms"] >= 60
+    assert slow.headers["x-profile-id"] == profile["id"]
+
+
+def test_ring_buffer_keeps_newest_captures(client, settings):
+    settings.setattr(profiling, "_captures", collections.deque(maxlen=2))
+
+    ids = [client.post("/summarize", headers={"X-Debug-Profile": TOKEN}).headers["x-profile-id"] for _ in range(3)]
+
+    assert [profile["id"] for profile in admin_list(client)] == [ids[2], ids[1]]
+
+
+def test_admin_endpoints_are_hidden_when_disabled(client, settings):
+    settings.setattr(profiling, "PROFILE_ADMIN_TOKEN", None)
+
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": TOKEN}).status_code == 404
+    settings.setattr(profiling, "PROFILE_ADMIN_TOKEN", TOKEN)
+    settings.setattr(profiling, "PROFILING_ENABLED", False)
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": TOKEN}).status_code == 404
+
+
+@pytest.mark.parametrize("token", [None, "wrong", "s\xe9cret".encode("latin-1")])
+def test_admin_endpoints_reject_bad_tokens(client, token):
+    headers = {"X-Admin-Token": token} if token else {}
+
+    assert client.get("/admin/profiles", headers=headers).status_code == 403
+    assert client.get("/admin/profiles/abc", headers=headers).status_code == 403
+
+
+def test_non_ascii_debug_header_is_ignored(client):
+    response = client.post("/summarize", headers={"X-Debug-Profile": "\xff".encode("latin-1")})
+
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+
+
+def test_download_is_folded_stacks(client):
+    profile_id = client.post("/summarize?ms=50", headers={"X-Debug-Profile": TOKEN}).headers["x-profile-id"]
+
+    response = client.get(f"/admin/profiles/{profile_id}", headers={"X-Admin-Token": TOKEN})
+
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == f'attachment; filename="{profile_id}.folded"'
+    lines = response.text.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert ";" in stack
+    assert any("busy_a (test_profiling.py:" in line for line in lines)
+    assert client.get("/admin/profiles/missing", headers={"X-Admin-Token": TOKEN}).status_code == 404
+
+
+async def overlapping_requests(first_headers, second_headers):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # "a" blocks first; "b" blocks while "a" is still in flight.
+        return await asyncio.gather(
+            client.post("/summarize?work=a&ms=100&before=0.02&after=0.3", headers=first_headers),
+            client.post("/summarize?work=b&ms=100&before=0.05", headers=second_headers),
+        )
+
+
+def folded_for(response):
+    profile_id = response.headers["x-profile-id"]
+    for profile in profiling._captures:
+        if profile.id == profile_id:
+            return profile.folded()
+    raise AssertionError(f"profile {profile_id} not captured")
+
+
+def test_overlapping_profiled_requests_keep_their_own_samples():
+    headers = {"X-Debug-Profile": TOKEN}
+    first, second = asyncio.run(overlapping_requests(headers, headers))
+
+    assert "busy_a" in folded_for(first) and "busy_b" not in folded_for(first)
+    assert "busy_b" in folded_for(second) and "busy_a" not in folded_for(second)
+
+
+def test_unprofiled_request_samples_are_not_credited_to_profiled_one():
+    first, second = asyncio.run(overlapping_requests({"X-Debug-Profile": TOKEN}, {}))
+
+    assert "x-profile-id" not in second.headers
+    assert "busy_a" in folded_for(first)
+    assert "busy_b" not in folded_for(first)